@@ -1,12 +1,16 @@
 import streamlit as st
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import signal
 import plotly.graph_objects as go
-import time
+from plotly.subplots import make_subplots
+import plotly.io as pio
+from scipy.fft import next_fast_len
+from scipy.signal import get_window
 from streamlit_extras.metric_cards import style_metric_cards
 import pandas as pd
 from PIL import Image
+from tsdownsample import LTTBDownsampler
+from signal_kernels import synthesize_signal
 
 # =============================================
 # APP CONFIGURATION
@@ -18,6 +22,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Serialize figures with orjson (much faster on large numeric arrays)
+pio.json.config.default_engine = "orjson"
+
 # Custom CSS for professional medical UI
 st.markdown("""
 <style>
@@ -49,6 +56,76 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# =============================================
+# SIGNAL PROCESSING HELPERS
+# =============================================
+NPERSEG = 1024        # samples per spectral segment (50% overlap)
+MIN_FFT_POINTS = 256  # never transform fewer points than this
+
+def fft_power_real(x, fs):
+    """One-sided power spectral density of real-valued segments (last axis)."""
+    nperseg = x.shape[-1]
+    n = next_fast_len(max(nperseg, MIN_FFT_POINTS), real=True)  # avoid slow prime-length FFTs
+    window = get_window('hann', nperseg)  # periodic Hann, as in signal.welch
+    x = x - x.mean(axis=-1, keepdims=True)  # welch's default detrend='constant'
+    X = np.fft.rfft(x * window, n=n)
+    Pxx = np.abs(X)**2 / (fs * (window**2).sum())
+    # Fold negative frequencies into the one-sided spectrum (an even n has an unpaired Nyquist bin)
+    if n % 2:
+        Pxx[..., 1:] *= 2
+    else:
+        Pxx[..., 1:-1] *= 2
+    f = np.fft.rfftfreq(n, 1 / fs)
+    return f, Pxx
+
+def build_signal(duration, sample_rate):
+    """Simulated phonocardiogram (float32), freshly randomized on every scan."""
+    rng = np.random.default_rng()
+    samples = int(duration * sample_rate)
+    
+    # Simulate potential LVNC abnormalities
+    has_abn = rng.random() > 0.6  # 40% chance of abnormal reading
+    
+    # Background and turbulence noise in one float32 draw
+    noise = rng.standard_normal((2, samples), dtype=np.float32)
+    
+    full_signal = np.empty(samples, dtype=np.float32)
+    synthesize_signal(1.0 / sample_rate, noise, full_signal, has_abn)
+    return full_signal
+
+# =============================================
+# PATIENT HISTORY DATA
+# =============================================
+@st.cache_data
+def get_history():
+    """Prior scans for the current patient (simulated, not yet keyed by patient ID)."""
+    return pd.DataFrame({
+        "Date": ["2023-06-15", "2023-03-22", "2022-11-10"],
+        "NC Ratio": [1.8, 1.7, 1.6],
+        "EF (%)": [58, 60, 62],
+        "Risk Score": [45, 38, 32],
+        "Findings": ["Stable", "Normal variant", "Initial screening"]
+    })
+
+@st.cache_resource
+def get_history_trend():
+    """Risk score trend figure for the patient's prior scans (shared, not copied per rerun)."""
+    history_data = get_history()
+    fig_trend = go.Figure()
+    fig_trend.add_trace(go.Scatter(
+        x=history_data["Date"],
+        y=history_data["Risk Score"],
+        mode='lines+markers',
+        name="Risk Score",
+        line=dict(color='#e74c3c', width=3)
+    ))
+    fig_trend.update_layout(
+        title="LVNC Risk Trend Over Time",
+        yaxis_title="Risk Score",
+        height=300
+    )
+    return fig_trend
+
 # =============================================
 # SIDEBAR - DEVICE CONTROL PANEL
 # =============================================
@@ -108,84 +185,96 @@ style_metric_cards(background_color="#FFFFFF", border_left_color="#e74c3c")
 # =============================================
 if st.button("▶️ Start Cardiac Scan", use_container_width=True):
     
-    # Progress bar
-    progress_bar = st.progress(0)
     status_text = st.empty()
     
-    # Initialize plot containers
-    wave_container = st.empty()
-    freq_container = st.empty()
-    analysis_container = st.empty()
-    
     # Simulate real-time data acquisition
     sample_rate = 44100
     duration = 10  # seconds
     samples = int(duration * sample_rate)
-    t = np.linspace(0, duration, samples, endpoint=False)
     
-    # Generate simulated heart sounds with possible abnormalities
-    base_signal = 0.5 * np.sin(2 * np.pi * 25 * t)  # Normal heart sound
-    noise = 0.1 * np.random.randn(samples)  # Background noise
+    full_signal = build_signal(duration, sample_rate)
     
-    # Simulate potential LVNC abnormalities
-    if np.random.rand() > 0.6:  # 40% chance of abnormal reading
-        abnormality = 0.3 * np.sin(2 * np.pi * 150 * t) * (t > 5)
-        abnormality += 0.2 * np.random.randn(samples) * (t > 7)
-    else:
-        abnormality = np.zeros(samples)
+    # Per-segment periodograms, computed once (averaging a prefix = Welch on that prefix)
+    segments = np.lib.stride_tricks.sliding_window_view(full_signal, NPERSEG)[::NPERSEG // 2]
+    f, Pxx_segments = fft_power_real(segments, sample_rate)
+    
+    # LTTB-downsample the whole recording once; the animation reveals it by widening the time axis
+    idx = LTTBDownsampler().downsample(full_signal, n_out=2000)
+    chunk_size = int(samples/100)
+    
+    # Spectrum refreshes every 5 ticks, averaging the segments that fit entirely in the
+    # samples revealed so far, as Welch would (a running sum, so each refresh is one row lookup)
+    revealed = (np.arange(0, 100, 5) + 1) * chunk_size
+    seg_counts = np.maximum(1, (revealed - NPERSEG) // (NPERSEG // 2) + 1)
+    Pxx_running = np.cumsum(Pxx_segments, axis=0)
+    spectra = (Pxx_running[seg_counts - 1] / seg_counts[:, None]).astype(np.float32)
+    
+    # One figure animated by plotly.js in the browser: the data is sent once, and each
+    # frame only widens the time axis and, every 5 ticks, swaps in the next spectrum
+    fig_scan = make_subplots(
+        rows=2, cols=1,
+        vertical_spacing=0.15,
+        subplot_titles=("Real-time Phonocardiogram", "Frequency Spectrum Analysis")
+    )
+    fig_scan.add_trace(go.Scattergl(
+        x=idx.astype(np.float32) * np.float32(1.0 / sample_rate),
+        y=full_signal[idx],
+        line=dict(color='#e74c3c', width=2),
+        name="Cardiac Signal"
+    ), row=1, col=1)
+    fig_scan.add_trace(go.Scatter(
+        x=f,
+        y=spectra[-1],
+        line=dict(color='#3498db', width=2),
+        name="Power Spectrum"
+    ), row=2, col=1)
     
-    full_signal = base_signal + noise + abnormality
+    # Fixed y ranges so the axes don't rescale from frame to frame
+    fig_scan.update_xaxes(title_text="Time (seconds)", range=[0, duration], row=1, col=1)
+    fig_scan.update_yaxes(title_text="Amplitude",
+                          range=[float(full_signal.min()), float(full_signal.max())], row=1, col=1)
+    fig_scan.update_xaxes(title_text="Frequency (Hz)", range=[0, 500], row=2, col=1)
+    fig_scan.update_yaxes(title_text="Power",
+                          range=[0, 1.05 * float(spectra[:, f <= 500].max())], row=2, col=1)
     
-    # Create dynamic visualization
+    frames = []
     for i in range(100):
-        # Update progress
-        progress_bar.progress(i + 1)
-        status_text.text(f"Scanning... {i+1}% complete")
-        
-        # Update waveform plot
-        chunk_size = int(samples/100)
-        display_samples = min((i+1)*chunk_size, samples)
-        
-        fig_wave = go.Figure()
-        fig_wave.add_trace(go.Scatter(
-            x=t[:display_samples],
-            y=full_signal[:display_samples],
-            line=dict(color='#e74c3c', width=2),
-            name="Cardiac Signal"
-        ))
-        fig_wave.update_layout(
-            title="Real-time Phonocardiogram",
-            xaxis_title="Time (seconds)",
-            yaxis_title="Amplitude",
-            height=300,
-            margin=dict(l=20, r=20, t=40, b=20)
+        frame = go.Frame(
+            name=str(i + 1),
+            layout=dict(xaxis=dict(range=[0, (i + 1) * chunk_size / sample_rate]))
         )
-        wave_container.plotly_chart(fig_wave, use_container_width=True)
-        
-        # Update frequency analysis every 5 steps
         if i % 5 == 0:
-            f, Pxx = signal.welch(full_signal[:display_samples], sample_rate, nperseg=1024)
-            fig_freq = go.Figure()
-            fig_freq.add_trace(go.Scatter(
-                x=f,
-                y=Pxx,
-                line=dict(color='#3498db', width=2),
-                name="Power Spectrum"
-            ))
-            fig_freq.update_layout(
-                title="Frequency Spectrum Analysis",
-                xaxis_title="Frequency (Hz)",
-                yaxis_title="Power",
-                height=300,
-                xaxis_range=[0, 500],
-                margin=dict(l=20, r=20, t=40, b=20)
-            )
-            freq_container.plotly_chart(fig_freq, use_container_width=True)
-        
-        time.sleep(0.05)
+            frame.data = [go.Scatter(y=spectra[i // 5])]
+            frame.traces = [1]
+        frames.append(frame)
+    fig_scan.frames = frames
+    
+    play_args = dict(frame=dict(duration=50, redraw=True), transition=dict(duration=0))
+    fig_scan.update_layout(
+        height=620,
+        showlegend=False,
+        margin=dict(l=20, r=20, t=40, b=20),
+        updatemenus=[dict(
+            type="buttons",
+            showactive=False,
+            x=0, y=-0.12,
+            xanchor="left", yanchor="top",
+            buttons=[dict(label="▶ Replay scan", method="animate", args=[None, play_args])]
+        )],
+        sliders=[dict(
+            active=19,
+            x=0.12, y=-0.08, len=0.88,
+            currentvalue=dict(prefix="Scanned: ", suffix="%"),
+            steps=[dict(
+                label=str(i + 1),
+                method="animate",
+                args=[[str(i + 1)], dict(mode="immediate", **play_args)]
+            ) for i in range(4, 100, 5)]
+        )]
+    )
+    st.plotly_chart(fig_scan, use_container_width=True)
     
     # After scan completion
-    progress_bar.empty()
     status_text.success("✅ Scan Complete - Analyzing Results...")
     
     # =============================================
@@ -235,7 +324,7 @@ if st.button("▶️ Start Cardiac Scan", use_container_width=True):
         }
     ))
     fig_risk.update_layout(height=300)
-    st.plotly_chart(fig_risk, use_container_width=True)
+    st.plotly_chart(fig_risk, use_container_width=True, config={'staticPlot': True, 'displayModeBar': False})
     
     # Recommendations
     if risk_score > 70:
@@ -272,30 +361,10 @@ if st.button("▶️ Start Cardiac Scan", use_container_width=True):
 with st.expander("📋 Patient History & Prior Scans"):
     if '🟢 Connected' in connection_status:
         # Simulated patient data
-        history_data = pd.DataFrame({
-            "Date": ["2023-06-15", "2023-03-22", "2022-11-10"],
-            "NC Ratio": [1.8, 1.7, 1.6],
-            "EF (%)": [58, 60, 62],
-            "Risk Score": [45, 38, 32],
-            "Findings": ["Stable", "Normal variant", "Initial screening"]
-        })
-        st.dataframe(history_data, hide_index=True, use_container_width=True)
+        st.dataframe(get_history(), hide_index=True, use_container_width=True)
         
         # Trend visualization
-        fig_trend = go.Figure()
-        fig_trend.add_trace(go.Scatter(
-            x=history_data["Date"],
-            y=history_data["Risk Score"],
-            mode='lines+markers',
-            name="Risk Score",
-            line=dict(color='#e74c3c', width=3)
-        ))
-        fig_trend.update_layout(
-            title="LVNC Risk Trend Over Time",
-            yaxis_title="Risk Score",
-            height=300
-        )
-        st.plotly_chart(fig_trend, use_container_width=True)
+        st.plotly_chart(get_history_trend(), use_container_width=True, config={'staticPlot': True, 'displayModeBar': False})
     else:
         st.warning("Connect device to access patient history")
 
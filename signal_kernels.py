@@ -0,0 +1,19 @@
+import numba
+import numpy as np
+
+# Kept out of lvnc-app.py: Streamlit re-executes the app script on every rerun,
+# which would create a fresh (uncompiled) dispatcher each time. An imported
+# module is cached in sys.modules, so the kernel compiles once per process.
+
+@numba.njit(fastmath=True, cache=True)
+def synthesize_signal(dt, noise, out, has_abn):
+    """Fused heart sound + noise + optional LVNC abnormality, one pass over `out`."""
+    for i in range(out.shape[0]):
+        ti = i * dt
+        v = 0.5 * np.sin(2 * np.pi * 25 * ti) + 0.1 * noise[0, i]
+        if has_abn:
+            if ti > 5:
+                v += 0.3 * np.sin(2 * np.pi * 150 * ti)
+            if ti > 7:
+                v += 0.2 * noise[1, i]
+        out[i] = v